@@ -1,6 +1,7 @@
 import streamlit as st
 import utils
 import io
+import uuid
 
 def check_password():
     """Returns `True` if the user had the correct password."""
@@ -188,21 +189,49 @@ st.markdown("""
 """, unsafe_allow_html=True)
 st.markdown("---")
 
+# Attribute LLM usage from this run to the current browser session
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+utils.set_usage_session(st.session_state['session_id'])
+
 # API Key Handling
 with st.sidebar:
     st.header("Settings")
-    st.markdown("Enter your Gemini API key below to enable AI features.")
+    llm_provider = utils.get_provider()
     
-    api_key = st.text_input(
-        "Gemini API Key", 
-        type="password",
-        help="Get your key at https://aistudio.google.com/app/apikey"
+    if llm_provider.requires_api_key:
+        st.markdown("Enter your Gemini API key below to enable AI features.")
+        
+        api_key = st.text_input(
+            "Gemini API Key", 
+            type="password",
+            help="Get your key at https://aistudio.google.com/app/apikey"
+        )
+        
+        if not api_key:
+            st.info("💡 Tip: You can get a free API key from [Google AI Studio](https://aistudio.google.com/app/apikey).")
+            st.warning("⚠️ API Key missing. Please provide it to proceed.")
+            st.stop()
+    else:
+        st.markdown(f"Using **{llm_provider.name}** as the AI backend.")
+        api_key = st.text_input(
+            "API Key (optional)",
+            type="password",
+            help="Only needed if your server requires authentication."
+        )
+
+    st.markdown("---")
+    speculative_prefetch = st.toggle(
+        "⚡ Speculative Prefetch",
+        value=False,
+        help="Start the ATS analysis in the background as soon as your resume and job description are ready, so results appear instantly."
+    )
+    prefetch_suite = st.checkbox(
+        "Also prefetch documents & interview suite",
+        value=False,
+        disabled=not speculative_prefetch,
+        help="Uses more API quota: runs the full generation suite in the background too."
     )
-    
-    if not api_key:
-        st.info("💡 Tip: You can get a free API key from [Google AI Studio](https://aistudio.google.com/app/apikey).")
-        st.warning("⚠️ API Key missing. Please provide it to proceed.")
-        st.stop()
 
 # Layout using Tabs for cleaner interface
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["1️⃣ Upload & Details", "2️⃣ ATS Analysis", "3️⃣ Generate Documents", "4️⃣ Career Insights", "5️⃣ Interview Preparation"])
@@ -268,39 +297,111 @@ with tab1:
         
         job_description = st.session_state['job_description']
 
+# Speculative prefetch: warm the result cache while the user is still on tab 1
+if 'prefetcher' not in st.session_state:
+    st.session_state['prefetcher'] = utils.SpeculativePrefetcher()
+prefetcher = st.session_state['prefetcher']
+
+if speculative_prefetch and resume_text and job_description:
+    prefetch_tasks = ["ats"] + (list(utils.SUITE_TASKS) if prefetch_suite else [])
+    prefetcher.schedule(resume_text, job_description, api_key, prefetch_tasks)
+else:
+    prefetcher.cancel()
+
+@st.fragment(run_every=1)
+def watch_prefetch():
+    """Polls the background prefetch and reruns the app once it finishes, so tabs 2 and 3 show its results."""
+    if st.session_state['prefetcher'].is_running():
+        st.caption("Prefetching in the background...")
+    else:
+        st.session_state['prefetch_pending'] = False
+        st.rerun()
+
+if speculative_prefetch:
+    if prefetcher.is_running():
+        st.session_state['prefetch_pending'] = True
+    with st.sidebar:
+        if st.session_state.get('prefetch_pending'):
+            watch_prefetch()
+        elif prefetcher.error:
+            st.caption(f"Prefetch stopped: {prefetcher.error}")
+
 
 with tab2:
     st.header("ATS Compatibility Check")
     if resume_text and job_description:
+        analysis_result = utils.get_cached_result("ats", resume_text, job_description)
         if st.button("Analyze My Resume", key="analyze_btn"):
             with st.spinner("Auditing your resume against the job description..."):
                 try:
-                    analysis_result = utils.analyze_ats_score(resume_text, job_description, api_key)
-                    st.markdown("### 📊 Analysis Result")
-                    st.text(analysis_result) # Use text to avoid markdown rendering issues if any remain
+                    analysis_result = utils.run_cached("ats", resume_text, job_description, api_key)
                 except Exception as e:
                     st.error(f"Analysis failed: {str(e)}")
+        if analysis_result:
+            st.markdown("### 📊 Analysis Result")
+            st.text(analysis_result) # Use text to avoid markdown rendering issues if any remain
     else:
         st.info("Please upload a resume and provide a job description in the first tab.")
 
 with tab3:
     st.header("Generate Optimized Documents")
     
+    # Session state keys for each task in the generation suite
+    suite_state_keys = {
+        "resume": "generated_resume",
+        "cover_letter": "generated_cover_letter",
+        "interview": "interview_questions",
+        "insights": "career_insights",
+        "screening": "screening_questions",
+        "final_interview": "final_interview_questions",
+    }
+
+    incremental_rewrite = st.checkbox(
+        "♻️ Only rewrite what changed",
+        value=False,
+        help="Rewrites your resume line by line and, on later runs, only regenerates lines you edited. Faster for iterative tailoring; keeps your original section layout."
+    )
+
+    # Pick up a suite that was prefetched in the background for the current inputs.
+    # The prefetched resume is a full rewrite, so leave the resume alone in incremental
+    # mode to keep it in step with resume_rewrite_state.
+    if speculative_prefetch and prefetch_suite and resume_text and job_description:
+        prefetched_suite = {task: utils.get_cached_result(task, resume_text, job_description) for task in utils.SUITE_TASKS}
+        if incremental_rewrite:
+            del prefetched_suite["resume"]
+        suite_inputs = (resume_text, job_description)
+        if all(prefetched_suite.values()) and st.session_state.get('suite_inputs') != suite_inputs:
+            for task, result in prefetched_suite.items():
+                st.session_state[suite_state_keys[task]] = result
+            st.session_state['suite_inputs'] = suite_inputs
+            if incremental_rewrite:
+                st.success("⚡ Your cover letter and interview prep were prepared in the background. Generate to update your resume.")
+            else:
+                st.success("⚡ Your documents were prepared in the background.")
+
     if st.button("✨ Generate Resume & Cover Letter", key="generate_btn"):
         if not resume_text or not job_description:
             st.error("Please complete the 'Upload & Details' tab first.")
         else:
             with st.spinner("Crafting your professional documents..."):
                 try:
-                    # Generate Content
-                    st.session_state['generated_resume'] = utils.generate_resume_content(resume_text, job_description, api_key)
-                    st.session_state['generated_cover_letter'] = utils.generate_cover_letter_content(resume_text, job_description, api_key)
-                    st.session_state['interview_questions'] = utils.generate_interview_questions(resume_text, job_description, api_key)
-                    st.session_state['career_insights'] = utils.generate_career_insights(resume_text, job_description, api_key)
-                    st.session_state['screening_questions'] = utils.generate_screening_questions(resume_text, job_description, api_key)
-                    st.session_state['final_interview_questions'] = utils.generate_final_interview_questions(resume_text, job_description, api_key)
+                    # Generate Content (instant for anything already prefetched)
+                    for task in utils.SUITE_TASKS:
+                        if task == "resume" and incremental_rewrite:
+                            st.session_state['generated_resume'], st.session_state['resume_rewrite_state'] = utils.generate_resume_content_incremental(
+                                resume_text, job_description, api_key, st.session_state.get('resume_rewrite_state')
+                            )
+                        else:
+                            st.session_state[suite_state_keys[task]] = utils.run_cached(task, resume_text, job_description, api_key)
+                    st.session_state['suite_inputs'] = (resume_text, job_description)
                     st.balloons()
                     st.success("Documents & complete interview suite generated successfully!")
+                    if incremental_rewrite:
+                        rewrite_state = st.session_state['resume_rewrite_state']
+                        if rewrite_state['full_rewrite']:
+                            st.caption("Resume: no section headings were recognised, so the whole resume was rewritten.")
+                        else:
+                            st.caption(f"Resume: rewrote {rewrite_state['rewritten_lines']} lines, reused {rewrite_state['reused_lines']} unchanged lines.")
                 except Exception as e:
                     st.error(f"Generation failed: {str(e)}")
 
@@ -367,25 +468,86 @@ with tab5:
             
         st.markdown("---")
         st.subheader("🎤 Mock Interview Practice")
-        st.markdown("Paste a question from above and your draft answer to get professional coaching.")
+        practice_mode = st.radio("Practice Mode", ["Single Question", "Batch Practice"], horizontal=True, key="practice_mode")
         
-        practice_q = st.text_input("Interview Question")
-        practice_a = st.text_area("Your Answer", height=150)
-        
-        if st.button("Get Expert Feedback"):
-            if practice_q and practice_a:
-                with st.spinner("Analyzing your response..."):
-                    try:
-                        feedback = utils.provide_interview_feedback(practice_q, practice_a, job_description, api_key)
-                        st.markdown("### 📝 Coaching Feedback")
-                        st.text(feedback)
-                    except Exception as e:
-                        st.error(f"Feedback failed: {str(e)}")
-            else:
-                st.warning("Please provide both a question and your answer.")
+        if practice_mode == "Single Question":
+            st.markdown("Paste a question from above and your draft answer to get professional coaching.")
+            
+            practice_q = st.text_input("Interview Question")
+            practice_a = st.text_area("Your Answer", height=150)
+            
+            if st.button("Get Expert Feedback"):
+                if practice_q and practice_a:
+                    with st.spinner("Analyzing your response..."):
+                        try:
+                            feedback = utils.provide_interview_feedback(practice_q, practice_a, job_description, api_key)
+                            st.markdown("### 📝 Coaching Feedback")
+                            st.text(feedback)
+                        except Exception as e:
+                            st.error(f"Feedback failed: {str(e)}")
+                else:
+                    st.warning("Please provide both a question and your answer.")
+        else:
+            st.markdown("Add several questions with your draft answers and grade them all at once. Unchanged answers come back instantly.")
+            
+            practice_rows = st.data_editor(
+                [{"Question": "", "Answer": ""}],
+                num_rows="dynamic",
+                use_container_width=True,
+                key="practice_pairs"
+            )
+            
+            if st.button("Grade All Answers"):
+                practice_pairs = [
+                    (row.get("Question") or "", row.get("Answer") or "")
+                    for row in practice_rows
+                ]
+                practice_pairs = [(q, a) for q, a in practice_pairs if q.strip() and a.strip()]
+                if practice_pairs:
+                    with st.spinner(f"Grading {len(practice_pairs)} answers..."):
+                        try:
+                            feedbacks = utils.provide_batch_interview_feedback(practice_pairs, job_description, api_key)
+                            st.markdown("### 📝 Coaching Feedback")
+                            for i, ((q, _), feedback) in enumerate(zip(practice_pairs, feedbacks), start=1):
+                                with st.expander(f"Q{i}: {q}", expanded=(i == 1)):
+                                    st.text(feedback)
+                        except Exception as e:
+                            st.error(f"Feedback failed: {str(e)}")
+                else:
+                    st.warning("Please provide at least one question with an answer.")
     else:
         st.info("Complete the document generation in the 'Generate Documents' tab to unlock your interview prep.")
 
+# Usage summary (rendered last so it includes this run's calls)
+with st.sidebar:
+    with st.expander("📊 Usage", expanded=False):
+        ledger = utils.get_ledger()
+        session_usage = ledger.summary(session=st.session_state['session_id'])
+        key_tokens = ledger.tokens_used(key=utils.key_fingerprint(api_key))
+        window_hours = utils.budget_window_seconds() / 3600
+        
+        col_session, col_key = st.columns(2)
+        col_session.metric("Session tokens", sum(t["prompt_tokens"] + t["response_tokens"] for t in session_usage.values()))
+        col_key.metric(f"Key tokens ({window_hours:g}h)", key_tokens)
+        st.caption(f"Saved by cache: ~{sum(t['saved_tokens'] for t in session_usage.values())} tokens")
+        
+        if session_usage:
+            st.dataframe(
+                [
+                    {
+                        "Task": task,
+                        "Calls": t["calls"],
+                        "Tokens": t["prompt_tokens"] + t["response_tokens"],
+                        "Avg latency (s)": round(t["latency_seconds"] / t["calls"], 1) if t["calls"] else 0,
+                        "Cache hits": t["cache_hits"],
+                    }
+                    for task, t in sorted(session_usage.items())
+                ],
+                hide_index=True,
+                use_container_width=True
+            )
+        st.caption(f"Totals cover the last {window_hours:g} hours (the budget window). Token counts are estimates (~4 characters per token).")
+
 # SEO Footer
 st.markdown("---")
 st.markdown("""
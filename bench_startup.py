@@ -0,0 +1,76 @@
+"""
+Measures the cold-start cost of `import utils`.
+
+Each sample runs in a fresh interpreter so nothing is cached in sys.modules.
+Reports wall-clock import time, peak RSS, and which heavy dependencies got
+loaded. The "eager" row imports every heavy dependency up front, which is
+what `import utils` used to cost before those imports were made lazy.
+
+Usage:
+    python bench_startup.py [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "docx",
+    "reportlab.pdfgen.canvas",
+    "pdfminer.high_level",
+    "google.generativeai",
+    "requests",
+]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def run_probe(imports):
+    code = PROBE.format(imports=imports, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout)
+
+
+def benchmark(label, imports, runs):
+    try:
+        samples = [run_probe(imports) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"{label:<8} skipped ({e})")
+        return
+    seconds = statistics.median(s["seconds"] for s in samples)
+    rss_mb = statistics.median(s["max_rss_kb"] for s in samples) / 1024
+    loaded = ", ".join(samples[0]["heavy_loaded"]) or "none"
+    print(f"{label:<8} {seconds * 1000:8.1f} ms  {rss_mb:7.1f} MB RSS  heavy modules: {loaded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    eager_imports = "\n".join(f"import {m}" for m in HEAVY_MODULES) + "\nimport utils"
+    benchmark("lazy", "import utils", args.runs)
+    benchmark("eager", eager_imports, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,22 @@ import unittest
 from unittest.mock import patch, MagicMock
 import utils
 import io
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+def setUpModule():
+    # Keep usage accounting out of the working directory during tests
+    global _ledger_dir
+    _ledger_dir = tempfile.TemporaryDirectory()
+    utils.set_ledger(utils.UsageLedger(os.path.join(_ledger_dir.name, "usage.jsonl")))
+
+def tearDownModule():
+    utils.set_ledger(None)
+    _ledger_dir.cleanup()
 
 class TestATSGeneratorLLM(unittest.TestCase):
     
@@ -44,5 +60,499 @@ class TestATSGeneratorLLM(unittest.TestCase):
         self.assertIsNotNone(doc_stream)
         self.assertTrue(doc_stream.getbuffer().nbytes > 0)
 
+class TestInterviewFeedback(unittest.TestCase):
+
+    def setUp(self):
+        utils._feedback_cache.clear()
+
+    @patch('utils.call_llm')
+    def test_feedback_is_cached_for_unchanged_answer(self, mock_call_llm):
+        mock_call_llm.return_value = "Feedback: Solid answer."
+
+        first = utils.provide_interview_feedback("Why us?", "Because.", "JD", "key")
+        second = utils.provide_interview_feedback("Why us?", "Because.  ", "JD", "key")
+
+        self.assertEqual(first, second)
+        mock_call_llm.assert_called_once()
+
+    @patch('utils.call_llm')
+    def test_batch_feedback_preserves_order_and_dedupes(self, mock_call_llm):
+        mock_call_llm.side_effect = lambda prompt, api_key, task=None: "Graded: " + prompt.split("Candidate's Answer:")[1].split()[0]
+
+        pairs = [("Q1", "alpha"), ("Q2", "beta"), ("Q1", "alpha")]
+        feedback = utils.provide_batch_interview_feedback(pairs, "JD", "key")
+
+        self.assertEqual(feedback, ["Graded: alpha", "Graded: beta", "Graded: alpha"])
+        self.assertEqual(mock_call_llm.call_count, 2)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = utils.LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+
+class TestLLMProviders(unittest.TestCase):
+
+    def tearDown(self):
+        utils.set_provider(None)
+
+    def test_stub_provider_is_deterministic(self):
+        utils.set_provider(utils.StubProvider())
+
+        first = utils.call_llm("prompt", None, task="ats")
+        second = utils.call_llm("prompt", None, task="ats")
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("Stub response from stub ("))
+
+    @patch('requests.post')
+    def test_openai_compatible_provider_calls_chat_completions(self, mock_post):
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "Hello from vLLM"}}]}
+        provider = utils.OpenAICompatibleProvider("http://localhost:8000/v1/")
+
+        result = provider.generate("Write a summary", "llama-3-8b", None)
+
+        self.assertEqual(result, "Hello from vLLM")
+        args, kwargs = mock_post.call_args
+        self.assertEqual(args[0], "http://localhost:8000/v1/chat/completions")
+        self.assertEqual(kwargs["json"], {"model": "llama-3-8b", "messages": [{"role": "user", "content": "Write a summary"}]})
+        self.assertNotIn("Authorization", kwargs["headers"])
+        mock_post.return_value.raise_for_status.assert_called_once()
+
+    @patch('requests.post')
+    def test_openai_compatible_provider_sends_bearer_key(self, mock_post):
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "ok"}}]}
+
+        utils.OpenAICompatibleProvider().generate("prompt", "model", "server-key")
+
+        self.assertEqual(mock_post.call_args[1]["headers"]["Authorization"], "Bearer server-key")
+
+    @patch.dict('os.environ', {'LLM_MODEL': 'fast-model', 'LLM_MODEL_RESUME': 'strong-model'})
+    def test_models_are_routed_per_task(self):
+        provider = utils.StubProvider()
+
+        self.assertEqual(utils.resolve_model("resume", provider), "strong-model")
+        self.assertEqual(utils.resolve_model("screening", provider), "fast-model")
+
+
+class TestSpeculativePrefetch(unittest.TestCase):
+
+    def setUp(self):
+        utils._result_cache.clear()
+
+    @patch('utils.call_llm')
+    def test_prefetch_fills_result_cache(self, mock_call_llm):
+        mock_call_llm.return_value = "Match Score: 80/100"
+        prefetcher = utils.SpeculativePrefetcher(debounce_seconds=0)
+
+        prefetcher.schedule("resume", "jd", "key", ["ats"])
+        prefetcher._thread.join(timeout=5)
+
+        self.assertEqual(utils.get_cached_result("ats", "resume", "jd"), "Match Score: 80/100")
+        self.assertEqual(utils.run_cached("ats", "resume", "jd", "key"), "Match Score: 80/100")
+        mock_call_llm.assert_called_once()
+
+    @patch('utils.call_llm')
+    def test_changed_inputs_cancel_pending_work(self, mock_call_llm):
+        mock_call_llm.return_value = "Match Score: 80/100"
+        prefetcher = utils.SpeculativePrefetcher(debounce_seconds=0.5)
+
+        prefetcher.schedule("old resume", "jd", "key", ["ats"])
+        first_thread = prefetcher._thread
+        prefetcher.schedule("new resume", "jd", "key", ["ats"])
+        first_thread.join(timeout=5)
+        prefetcher._thread.join(timeout=5)
+
+        self.assertIsNone(utils.get_cached_result("ats", "old resume", "jd"))
+        self.assertIsNotNone(utils.get_cached_result("ats", "new resume", "jd"))
+        mock_call_llm.assert_called_once()
+
+    @patch('utils.call_llm')
+    def test_superseded_run_does_not_report_errors(self, mock_call_llm):
+        started = threading.Event()
+
+        def slow_failure(prompt, api_key, task=None):
+            started.set()
+            time.sleep(0.2)
+            raise Exception("upstream timeout")
+
+        mock_call_llm.side_effect = slow_failure
+        prefetcher = utils.SpeculativePrefetcher(debounce_seconds=0)
+        prefetcher.schedule("old resume", "jd", "key", ["ats"])
+        first_thread = prefetcher._thread
+        started.wait(timeout=5)
+        prefetcher.cancel()
+        first_thread.join(timeout=5)
+
+        self.assertIsNone(prefetcher.error)
+
+
+class TestLongInputs(unittest.TestCase):
+
+    def setUp(self):
+        utils._digest_cache.clear()
+
+    def test_denoise_strips_navigation_and_keeps_link_text(self):
+        markdown = (
+            "URL Source: https://jobs.example.com/1\n"
+            "* [Home](https://example.com) | [Careers](https://example.com/careers)\n"
+            "![logo](https://example.com/logo.png)\n"
+            "We need a [Python](https://python.org) engineer.\n"
+            "We need a Python engineer.\n"
+        )
+
+        self.assertEqual(utils.denoise_markdown(markdown), "We need a Python engineer.")
+
+    def test_chunks_respect_size_limit(self):
+        text = "\n\n".join(["word " * 300] * 20)
+
+        chunks = utils.chunk_text(text, max_chars=2000)
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(chunk) <= 2000 for chunk in chunks))
+
+    @patch('utils.call_llm')
+    def test_pasted_job_description_is_not_denoised(self, mock_call_llm):
+        pasted = "Apply at https://example.com/apply\nPython\nPython"
+
+        self.assertEqual(utils.prepare_job_description(pasted, "key"), pasted)
+        mock_call_llm.assert_not_called()
+
+    @patch('utils.call_llm')
+    def test_short_input_is_not_condensed(self, mock_call_llm):
+        self.assertEqual(utils.condense_input("short resume", "resume", "key"), "short resume")
+        mock_call_llm.assert_not_called()
+
+    @patch('utils.call_llm')
+    def test_oversized_input_is_condensed_and_cached(self, mock_call_llm):
+        mock_call_llm.return_value = "Condensed chunk."
+        text = "\n\n".join(["Led a team of engineers. " * 40] * 30)
+
+        digest = utils.condense_input(text, "resume", "key")
+        calls = mock_call_llm.call_count
+        again = utils.condense_input(text, "resume", "key")
+
+        self.assertTrue(len(digest) <= utils.MAX_INPUT_CHARS)
+        self.assertIn("Condensed chunk.", digest)
+        self.assertEqual(digest, again)
+        self.assertEqual(mock_call_llm.call_count, calls)
+
+
+class TestUsageAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger_path = os.path.join(self.tmp.name, "usage.jsonl")
+        utils.set_ledger(utils.UsageLedger(self.ledger_path))
+        utils.set_provider(utils.StubProvider())
+        utils.set_usage_session("session-1")
+        utils._result_cache.clear()
+
+    def tearDown(self):
+        utils.set_provider(None)
+        utils.set_usage_session(None)
+        utils.set_ledger(utils.UsageLedger(os.path.join(_ledger_dir.name, "usage.jsonl")))
+        self.tmp.cleanup()
+
+    def test_calls_and_cache_hits_are_recorded(self):
+        utils.run_cached("ats", "Python developer", "Python role", "secret-key")
+        utils.run_cached("ats", "Python developer", "Python role", "secret-key")
+
+        summary = utils.get_ledger().summary(session="session-1")["ats"]
+        self.assertEqual(summary["calls"], 1)
+        self.assertEqual(summary["cache_hits"], 1)
+        self.assertTrue(summary["saved_tokens"] > 0)
+
+        with open(self.ledger_path) as f:
+            contents = f.read()
+        self.assertEqual(len(contents.splitlines()), 2)
+        self.assertNotIn("secret-key", contents)
+
+    def test_records_outside_budget_window_are_pruned(self):
+        ledger = utils.UsageLedger(self.ledger_path, window_seconds=60)
+        ledger.record(session="s", key="k", prompt_tokens=100, response_tokens=0, timestamp=time.time() - 120)
+        ledger.record(session="s", key="k", prompt_tokens=5, response_tokens=5)
+
+        self.assertEqual(ledger.tokens_used(key="k"), 10)
+        self.assertEqual(utils.UsageLedger(self.ledger_path, window_seconds=60).tokens_used(session="s"), 10)
+
+    def test_usage_from_other_processes_is_shared(self):
+        worker_a = utils.UsageLedger(self.ledger_path)
+        worker_b = utils.UsageLedger(self.ledger_path)
+
+        worker_a.record(session="s", key="k", prompt_tokens=40, response_tokens=2)
+
+        self.assertEqual(worker_b.tokens_used(key="k"), 42)
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_SESSION': '10', 'LLM_BUDGET_POLICY': 'refuse'})
+    def test_budget_refuses_over_limit(self):
+        with self.assertRaises(utils.BudgetExceededError):
+            utils.call_llm("x" * 400, "key", task="screening")
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_KEY': '10', 'LLM_BUDGET_POLICY': 'degrade'})
+    def test_budget_degrades_ats_to_local_scoring(self):
+        result = utils.analyze_ats_score("Python and Django developer", "Python Django Kubernetes", "key")
+
+        self.assertIn("Match Score: 67/100", result)
+        self.assertIn("- kubernetes", result)
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_KEY': '10', 'LLM_BUDGET_POLICY': 'degrade', 'LLM_MODEL_RESUME': 'gemini-1.5-pro'})
+    def test_fallback_gets_its_own_key_and_model(self):
+        fallback = MagicMock(spec=utils.LLMProvider)
+        fallback.name = "Local server"
+        fallback.default_model = "local-model"
+        fallback.generate.return_value = "Local rewrite"
+
+        with patch('utils.get_fallback_provider', return_value=fallback):
+            result = utils.call_llm("x" * 400, "USER-GEMINI-KEY", task="resume")
+            with patch.dict('os.environ', {'LLM_FALLBACK_MODEL': 'llama-3-8b', 'LLM_FALLBACK_API_KEY': 'local-key'}):
+                utils.call_llm("y" * 400, "USER-GEMINI-KEY", task="resume")
+
+        self.assertEqual(result, "Local rewrite")
+        self.assertEqual(fallback.generate.call_args_list[0][0][1:], ("local-model", None))
+        self.assertEqual(fallback.generate.call_args_list[1][0][1:], ("llama-3-8b", "local-key"))
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_SESSION': '50', 'LLM_BUDGET_POLICY': 'degrade'})
+    def test_in_budget_caller_does_not_coalesce_onto_degraded_leader(self):
+        utils.get_ledger().record(session="over", key="k", prompt_tokens=100, response_tokens=0)
+        fallback_started = threading.Event()
+        fallback = MagicMock(spec=utils.LLMProvider)
+        fallback.name = "Local server"
+        fallback.default_model = "local-model"
+
+        def slow_local(prompt, model, api_key):
+            fallback_started.set()
+            time.sleep(0.3)
+            return "LOCAL"
+
+        fallback.generate.side_effect = slow_local
+        results = {}
+
+        def caller(session):
+            utils.set_usage_session(session)
+            results[session] = utils.call_llm("same prompt", "key", task="screening")
+
+        with patch('utils.get_fallback_provider', return_value=fallback):
+            over = threading.Thread(target=caller, args=("over",))
+            over.start()
+            fallback_started.wait(timeout=5)
+            fresh = threading.Thread(target=caller, args=("fresh",))
+            fresh.start()
+            over.join()
+            fresh.join()
+
+        self.assertEqual(results["over"], "LOCAL")
+        self.assertTrue(results["fresh"].startswith("Stub response"))
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_KEY': '10', 'LLM_BUDGET_POLICY': 'degrade'})
+    def test_degraded_ats_score_is_not_cached(self):
+        degraded = utils.run_cached("ats", "Python developer", "Python role", "key")
+        self.assertIn("estimated locally", degraded)
+
+        with patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_KEY': '0'}):
+            result = utils.run_cached("ats", "Python developer", "Python role", "key")
+
+        self.assertNotIn("estimated locally", result)
+
+    @patch.dict('os.environ', {'LLM_BUDGET_TOKENS_PER_KEY': '10', 'LLM_BUDGET_POLICY': 'degrade'})
+    def test_oversized_input_degrades_to_local_scoring(self):
+        resume = "Python developer. " * 1000
+
+        result = utils.analyze_ats_score(resume, "Python Kubernetes", "key")
+
+        self.assertIn("Match Score: 50/100", result)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_identical_calls_share_one_computation(self):
+        flight = utils.SingleFlight()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertTrue(all(result == "result" for result, _ in results))
+
+    def test_unshareable_result_is_not_passed_to_waiters(self):
+        flight = utils.SingleFlight()
+        started = threading.Event()
+        outcomes = {}
+
+        def degraded():
+            started.set()
+            time.sleep(0.2)
+            return "LOCAL"
+
+        leader_thread = threading.Thread(target=lambda: outcomes.update(leader=flight.do("key", degraded, shareable=lambda r: r != "LOCAL")))
+        leader_thread.start()
+        started.wait()
+        outcomes["waiter"] = flight.do("key", lambda: "REAL", shareable=lambda r: r != "LOCAL")
+        leader_thread.join()
+
+        self.assertEqual(outcomes, {"leader": ("LOCAL", False), "waiter": ("REAL", False)})
+
+    def test_single_waiter_retries_after_leader_fails(self):
+        flight = utils.SingleFlight()
+        started = threading.Event()
+        retries = []
+        outcomes = []
+
+        def failing():
+            started.set()
+            time.sleep(0.2)
+            raise Exception("invalid key")
+
+        def retry():
+            retries.append(1)
+            time.sleep(0.1)
+            return "ok"
+
+        def leader():
+            try:
+                flight.do("key", failing)
+            except Exception as e:
+                outcomes.append(str(e))
+
+        leader_thread = threading.Thread(target=leader)
+        leader_thread.start()
+        started.wait()
+        waiters = [threading.Thread(target=lambda: outcomes.append(flight.do("key", retry))) for _ in range(4)]
+        for t in waiters:
+            t.start()
+        for t in waiters + [leader_thread]:
+            t.join()
+
+        self.assertIn("invalid key", outcomes)
+        self.assertEqual(len(retries), 1)
+        self.assertEqual(sorted(o for o in outcomes if o != "invalid key"), [("ok", False), ("ok", True), ("ok", True), ("ok", True)])
+
+
+class TestIncrementalResumeRewrite(unittest.TestCase):
+
+    RESUME = "Jane Doe\njane@example.com\n\nSUMMARY\nBackend engineer.\n\nExperience:\n- Built APIs.\n- Led a team.\n"
+
+    @staticmethod
+    def fake_llm(prompt, api_key, task=None):
+        lines = prompt.split("Lines to Rewrite:")[1].strip().split("\n")
+        return "\n".join(line.strip().replace("] ", "] Tailored ", 1) for line in lines)
+
+    def test_sections_are_split_on_headings(self):
+        sections = utils.split_resume_sections(self.RESUME)
+
+        self.assertEqual([heading for heading, _ in sections], ["", "SUMMARY", "Experience:"])
+
+    @patch('utils.call_llm')
+    def test_only_changed_lines_are_rewritten(self, mock_call_llm):
+        mock_call_llm.side_effect = self.fake_llm
+
+        first, state = utils.generate_resume_content_incremental(self.RESUME, "JD", "key")
+        self.assertIn("Tailored Backend engineer.", first)
+        self.assertIn("jane@example.com", first)
+        self.assertEqual(state["rewritten_lines"], 3)
+
+        mock_call_llm.reset_mock()
+        edited = self.RESUME.replace("Led a team.", "Led a team of five.")
+        second, state = utils.generate_resume_content_incremental(edited, "JD", "key", state)
+
+        mock_call_llm.assert_called_once()
+        self.assertNotIn("Built APIs", mock_call_llm.call_args[0][0].split("Lines to Rewrite:")[1])
+        self.assertIn("Tailored - Led a team of five.", second)
+        self.assertIn("Tailored - Built APIs.", second)
+        self.assertEqual((state["rewritten_lines"], state["reused_lines"]), (1, 2))
+
+    def test_heading_detection_ignores_names_and_skill_lists(self):
+        resume = "JOHN DOE\njohn@example.com\nlinkedin.com/in/johndoe\n\nWork History\n- Built APIs.\n\nSKILLS\nAWS, GCP, SQL\nPython\n"
+
+        sections = utils.split_resume_sections(resume)
+
+        self.assertEqual([heading for heading, _ in sections], ["", "Work History", "SKILLS"])
+        self.assertIn("JOHN DOE", sections[0][1])
+        self.assertIn("Python", sections[2][1])
+
+    @patch('utils.call_llm')
+    def test_uppercase_name_keeps_contact_block_verbatim(self, mock_call_llm):
+        mock_call_llm.side_effect = self.fake_llm
+        resume = "JOHN DOE\njohn@example.com\n555-0100\n\nEXPERIENCE\n- Built APIs.\n"
+
+        output, state = utils.generate_resume_content_incremental(resume, "JD", "key")
+
+        self.assertTrue(output.startswith("JOHN DOE\njohn@example.com\n555-0100"))
+        self.assertNotIn("john@example.com", mock_call_llm.call_args[0][0].split("Lines to Rewrite:")[1])
+        self.assertEqual(state["rewritten_lines"], 1)
+
+    @patch('utils.call_llm')
+    def test_resume_without_headings_falls_back_to_full_rewrite(self, mock_call_llm):
+        mock_call_llm.return_value = "Fully rewritten resume"
+
+        output, state = utils.generate_resume_content_incremental("Jane Doe\nBuilt APIs at Acme.\n", "JD", "key")
+
+        self.assertEqual(output, "Fully rewritten resume")
+        self.assertTrue(state["full_rewrite"])
+        self.assertEqual(mock_call_llm.call_args[1]["task"], "resume")
+
+    @patch('utils.call_llm')
+    def test_long_section_prompts_stay_bounded(self, mock_call_llm):
+        mock_call_llm.side_effect = self.fake_llm
+        publications = "\n".join(f"- Paper {n}: " + "A long and detailed publication title. " * 5 for n in range(400))
+        resume = "Jane Doe\n\nPUBLICATIONS\n" + publications + "\n"
+
+        _, state = utils.generate_resume_content_incremental(resume, "JD", "key")
+        self.assertTrue(mock_call_llm.call_count > 1)
+        self.assertTrue(all(len(c[0][0]) < 2 * utils.CHUNK_CHARS for c in mock_call_llm.call_args_list))
+
+        mock_call_llm.reset_mock()
+        edited = resume.replace("- Paper 200:", "- Paper 200 (revised):")
+        _, state = utils.generate_resume_content_incremental(edited, "JD", "key", state)
+
+        mock_call_llm.assert_called_once()
+        prompt = mock_call_llm.call_args[0][0]
+        self.assertTrue(len(prompt) < 2 * utils.CHUNK_CHARS)
+        self.assertIn("Paper 199", prompt)
+        self.assertNotIn("Paper 150", prompt)
+
+    @patch('utils.call_llm')
+    def test_changed_job_description_rewrites_everything(self, mock_call_llm):
+        mock_call_llm.side_effect = self.fake_llm
+
+        _, state = utils.generate_resume_content_incremental(self.RESUME, "JD", "key")
+        _, state = utils.generate_resume_content_incremental(self.RESUME, "New JD", "key", state)
+
+        self.assertEqual(state["rewritten_lines"], 3)
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_import_utils_skips_heavy_dependencies(self):
+        code = (
+            "import sys, utils; "
+            "heavy = ['docx', 'reportlab', 'pdfminer', 'google.generativeai', 'requests', 'bs4']; "
+            "print(','.join(m for m in heavy if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.strip(), "")
+
+
 if __name__ == '__main__':
     unittest.main()
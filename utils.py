@@ -1,32 +1,562 @@
-from docx import Document
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 import io
 import os
-import google.generativeai as genai
-import requests
-from bs4 import BeautifulSoup
-from pdfminer.high_level import extract_text
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
+# Heavy dependencies (docx, reportlab, pdfminer, google.generativeai, requests) are
+# imported inside the functions that use them, so `import utils` stays cheap for
+# cold starts and for code paths that never touch PDFs or the network.
 
-def call_llm(prompt, api_key):
+
+# Inputs longer than this are condensed before being placed in a prompt
+MAX_INPUT_CHARS = 12000
+# Size of each chunk condensed in the map step
+CHUNK_CHARS = 6000
+MAX_CONDENSE_ROUNDS = 3
+MAX_CONDENSE_WORKERS = 4
+
+
+def _content_hash(*parts):
     """
-    Calls Google Gemini to generate content.
+    Returns a stable SHA-256 hex digest for the given text parts.
     """
-    genai.configure(api_key=api_key)
-    try:
-        # Using gemini-1.5-flash for better free tier quota limits
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        response = model.generate_content(prompt)
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe dict-like cache that evicts the least recently used entry beyond max_size.
+    The caches below are shared by every session, so they must stay bounded.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+# Memoized mock-interview feedback, keyed on the question/answer/JD content hash
+_feedback_cache = LRUCache(max_size=int(os.environ.get("FEEDBACK_CACHE_SIZE", 1000)))
+
+# Memoized analysis/generation results, keyed on task and the resume/JD content hash
+_result_cache = LRUCache(max_size=int(os.environ.get("RESULT_CACHE_SIZE", 500)))
+
+# Condensed digests of oversized inputs, keyed on the input content hash
+_digest_cache = LRUCache(max_size=int(os.environ.get("DIGEST_CACHE_SIZE", 200)))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation. Callers that
+    arrive while a call is in progress wait for it and share its result. If that call
+    fails, its error is not passed on (it may be another caller's invalid API key or
+    exhausted budget); instead one waiter becomes the new leader and retries while the
+    rest keep waiting, so a transient failure doesn't turn into a burst of retries.
+    Results that shareable() rejects (e.g. a fallback produced because the leader's own
+    budget ran out) are returned to the leader only and handled like a failure.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, shareable=None):
+        """
+        Returns (result, shared), where shared is True if another caller computed the result.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                break
+            flight.done.wait()
+            if not flight.failed:
+                return flight.result, True
+            # The leader failed: loop back so only the first waiter retries
+
+        try:
+            flight.result = fn()
+            flight.failed = shareable is not None and not shareable(flight.result)
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+# Shared across sessions so identical concurrent LLM calls and extraction jobs run once
+_single_flight = SingleFlight()
+
+class LLMProvider:
+    """
+    Base class for LLM backends. Subclasses implement generate().
+    """
+    name = "LLM"
+    default_model = None
+    requires_api_key = True
+
+    def generate(self, prompt, model, api_key):
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini backend.
+    """
+    name = "Google Gemini"
+    # Using gemini-1.5-flash for better free tier quota limits
+    default_model = "gemini-1.5-flash"
+
+    def generate(self, prompt, model, api_key):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        response = genai.GenerativeModel(model).generate_content(prompt)
         return response.text
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Backend for any server exposing the OpenAI chat completions API,
+    e.g. a local llama.cpp or vLLM server.
+    """
+    name = "OpenAI-compatible server"
+    default_model = "local-model"
+    requires_api_key = False
+
+    def __init__(self, base_url="http://localhost:8080/v1", timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def generate(self, prompt, model, api_key):
+        import requests
+
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        response = requests.post(f"{self.base_url}/chat/completions", json=payload, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic offline backend for development and tests. Never touches the network.
+    """
+    name = "Offline stub"
+    default_model = "stub"
+    requires_api_key = False
+
+    def generate(self, prompt, model, api_key):
+        digest = _content_hash(model, prompt)[:12]
+        return f"Stub response from {model} ({digest})."
+
+
+LLM_PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAICompatibleProvider,
+    "stub": StubProvider,
+}
+
+_provider = None
+_fallback_provider = None
+
+
+def _build_provider(provider_name, base_url=None):
+    provider_name = provider_name.lower()
+    if provider_name not in LLM_PROVIDERS:
+        raise Exception(f"Unknown LLM provider '{provider_name}'. Choose one of: {', '.join(LLM_PROVIDERS)}")
+    if provider_name == "openai" and base_url:
+        return OpenAICompatibleProvider(base_url)
+    return LLM_PROVIDERS[provider_name]()
+
+def get_provider():
+    """
+    Returns the active LLM provider, chosen by the LLM_PROVIDER environment variable
+    (gemini, openai or stub). LLM_BASE_URL points the openai backend at a server.
+    """
+    global _provider
+    if _provider is None:
+        _provider = _build_provider(os.environ.get("LLM_PROVIDER", "gemini"), os.environ.get("LLM_BASE_URL"))
+    return _provider
+
+def get_fallback_provider():
+    """
+    Returns the provider used when the budget policy is "degrade", chosen by
+    LLM_FALLBACK_PROVIDER and LLM_FALLBACK_BASE_URL, or None if not configured.
+    It is called with LLM_FALLBACK_MODEL (default: its own default model) and
+    LLM_FALLBACK_API_KEY (default: no key).
+    """
+    global _fallback_provider
+    if _fallback_provider is None and os.environ.get("LLM_FALLBACK_PROVIDER"):
+        _fallback_provider = _build_provider(os.environ["LLM_FALLBACK_PROVIDER"], os.environ.get("LLM_FALLBACK_BASE_URL"))
+    return _fallback_provider
+
+def set_provider(provider):
+    """
+    Overrides the active LLM provider.
+    """
+    global _provider
+    _provider = provider
+
+def resolve_model(task, provider):
+    """
+    Picks the model for a task. LLM_MODEL_<TASK> (e.g. LLM_MODEL_RESUME) wins over
+    LLM_MODEL, which wins over the provider default. This lets cheap, fast models
+    handle screening questions while a stronger model does the resume rewrite.
+    """
+    if task:
+        task_model = os.environ.get(f"LLM_MODEL_{task.upper()}")
+        if task_model:
+            return task_model
+    return os.environ.get("LLM_MODEL") or provider.default_model
+
+class BudgetExceededError(Exception):
+    """
+    Raised when an LLM call would exceed the configured session or API key budget.
+    """
+
+
+class UsageLedger:
+    """
+    Append-only JSONL log of LLM usage (one record per call or cache hit). Only records
+    inside the budget window are kept in memory, with running per-session and per-key
+    token totals. Lines appended by other worker processes are picked up on each read,
+    so key budgets are shared across processes using the same ledger file.
+    """
+
+    def __init__(self, path, window_seconds=None):
+        self.path = path
+        self.window_seconds = window_seconds if window_seconds is not None else budget_window_seconds()
+        self._lock = threading.Lock()
+        self._records = deque()
+        self._session_tokens = {}
+        self._key_tokens = {}
+        self._offset = 0
+        with self._lock:
+            self._sync()
+
+    @staticmethod
+    def _billed_tokens(entry):
+        if entry.get("cached"):
+            return 0
+        return entry.get("prompt_tokens", 0) + entry.get("response_tokens", 0)
+
+    def _add(self, entry):
+        self._records.append(entry)
+        tokens = self._billed_tokens(entry)
+        if tokens:
+            for totals, name in ((self._session_tokens, entry.get("session")), (self._key_tokens, entry.get("key"))):
+                totals[name] = totals.get(name, 0) + tokens
+
+    def _prune(self):
+        cutoff = time.time() - self.window_seconds
+        while self._records and self._records[0].get("timestamp", 0) < cutoff:
+            entry = self._records.popleft()
+            tokens = self._billed_tokens(entry)
+            if tokens:
+                for totals, name in ((self._session_tokens, entry.get("session")), (self._key_tokens, entry.get("key"))):
+                    totals[name] -= tokens
+                    if totals[name] <= 0:
+                        del totals[name]
+
+    def _sync(self):
+        """
+        Ingests lines appended to the file since the last read (by any process).
+        """
+        cutoff = time.time() - self.window_seconds
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Still being written by another process
+                    self._offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("timestamp", 0) >= cutoff:
+                        self._add(entry)
+        except OSError:
+            pass
+        self._prune()
+
+    def record(self, **entry):
+        entry.setdefault("timestamp", time.time())
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                # Accounting must never break generation; keep the in-memory record
+                self._add(entry)
+                self._prune()
+                return
+            self._sync()
+
+    def tokens_used(self, session=None, key=None):
+        """
+        Returns billed tokens (prompt + response, excluding cache hits) within the
+        budget window, for a session, an API key fingerprint, or overall.
+        """
+        with self._lock:
+            self._sync()
+            if session is not None:
+                return self._session_tokens.get(session, 0)
+            if key is not None:
+                return self._key_tokens.get(key, 0)
+            return sum(self._session_tokens.values())
+
+    def summary(self, session=None, key=None):
+        """
+        Returns per-task totals within the budget window: calls, prompt/response tokens,
+        latency, cache hits and tokens saved.
+        """
+        with self._lock:
+            self._sync()
+            records = [
+                r for r in self._records
+                if (session is None or r.get("session") == session)
+                and (key is None or r.get("key") == key)
+            ]
+        totals = {}
+        for r in records:
+            task = totals.setdefault(r.get("task") or "other", {
+                "calls": 0, "prompt_tokens": 0, "response_tokens": 0,
+                "latency_seconds": 0.0, "cache_hits": 0, "saved_tokens": 0
+            })
+            if r.get("cached"):
+                task["cache_hits"] += 1
+                task["saved_tokens"] += r.get("saved_tokens", 0)
+            else:
+                task["calls"] += 1
+                task["prompt_tokens"] += r.get("prompt_tokens", 0)
+                task["response_tokens"] += r.get("response_tokens", 0)
+                task["latency_seconds"] += r.get("latency_seconds", 0.0)
+        return totals
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+# Session id for usage accounting, set by the app at the start of each run
+_usage_session = contextvars.ContextVar("usage_session", default=None)
+
+
+def get_ledger():
+    """
+    Returns the usage ledger, stored at LLM_USAGE_LEDGER (default usage_ledger.jsonl).
+    """
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger(os.environ.get("LLM_USAGE_LEDGER", "usage_ledger.jsonl"))
+        return _ledger
+
+def set_ledger(ledger):
+    """
+    Overrides the usage ledger.
+    """
+    global _ledger
+    with _ledger_lock:
+        _ledger = ledger
+
+def set_usage_session(session_id):
+    """
+    Attributes subsequent LLM usage in this context to the given session.
+    """
+    _usage_session.set(session_id)
+
+def get_usage_session():
+    return _usage_session.get()
+
+def _in_current_context(fn):
+    """
+    Wraps fn so worker threads run it with the caller's context (e.g. the usage session).
+    """
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(fn, *args)
+
+def key_fingerprint(api_key):
+    """
+    Returns a short, non-reversible identifier for an API key. Raw keys are never stored.
+    """
+    return _content_hash(api_key)[:12] if api_key else "none"
+
+def estimate_tokens(text):
+    """
+    Approximates the token count of text (about 4 characters per token).
+    """
+    return max(1, len(text or "") // 4)
+
+def budget_window_seconds():
+    """
+    Returns the rolling budget window (LLM_BUDGET_WINDOW_SECONDS, default one day).
+    """
+    return int(os.environ.get("LLM_BUDGET_WINDOW_SECONDS", 86400))
+
+def _budget_overrun(session, key, requested_tokens):
+    """
+    Returns a description of the exceeded budget, or None if the call fits.
+    """
+    session_limit = int(os.environ.get("LLM_BUDGET_TOKENS_PER_SESSION", 0))
+    key_limit = int(os.environ.get("LLM_BUDGET_TOKENS_PER_KEY", 0))
+    ledger = get_ledger()
+    if session_limit and session is not None:
+        if ledger.tokens_used(session=session) + requested_tokens > session_limit:
+            return "session"
+    if key_limit:
+        if ledger.tokens_used(key=key) + requested_tokens > key_limit:
+            return "API key"
+    return None
+
+def _enforce_budget(session, key, requested_tokens):
+    """
+    Applies LLM_BUDGET_POLICY when a call would exceed its budget. "refuse" and
+    "degrade" raise BudgetExceededError (callers may degrade to cached or local
+    results); "queue" waits up to LLM_BUDGET_MAX_WAIT_SECONDS for the window to free up.
+    """
+    overrun = _budget_overrun(session, key, requested_tokens)
+    if overrun and os.environ.get("LLM_BUDGET_POLICY", "refuse") == "queue":
+        deadline = time.time() + float(os.environ.get("LLM_BUDGET_MAX_WAIT_SECONDS", 60))
+        while overrun and time.time() < deadline:
+            time.sleep(1)
+            overrun = _budget_overrun(session, key, requested_tokens)
+    if overrun:
+        raise BudgetExceededError(f"The {overrun} token budget has been reached. Please try again later.")
+
+def _record_cache_hit(task, saved_tokens, api_key, coalesced=False):
+    get_ledger().record(
+        session=get_usage_session(),
+        key=key_fingerprint(api_key),
+        task=task,
+        cached=True,
+        coalesced=coalesced,
+        saved_tokens=saved_tokens
+    )
+
+def call_llm(prompt, api_key, task=None):
+    """
+    Calls the active LLM provider to generate content, routing to the model configured for the task.
+    Each call is checked against the usage budgets and recorded in the usage ledger.
+    Identical prompts already in flight are coalesced into a single upstream request.
+    """
+    provider = get_provider()
+    flight_key = ("llm", _content_hash(provider.name, resolve_model(task, provider), prompt))
+    response_text, shared = _single_flight.do(
+        flight_key,
+        lambda: _call_llm_uncoalesced(prompt, api_key, task),
+        shareable=lambda result: not isinstance(result, DegradedResult)
+    )
+    if shared:
+        _record_cache_hit(task, estimate_tokens(prompt) + estimate_tokens(response_text), api_key, coalesced=True)
+    return response_text
+
+def _call_llm_uncoalesced(prompt, api_key, task):
+    provider = get_provider()
+    session = get_usage_session()
+    key = key_fingerprint(api_key)
+    prompt_tokens = estimate_tokens(prompt)
+    model = resolve_model(task, provider)
+    provider_key = api_key
+    degraded = False
+    try:
+        _enforce_budget(session, key, prompt_tokens)
+    except BudgetExceededError:
+        fallback = get_fallback_provider()
+        if os.environ.get("LLM_BUDGET_POLICY") != "degrade" or fallback is None:
+            raise
+        # Degrade to the (typically local) fallback provider, billed to no key. It gets
+        # its own credential and model: the user's key and the primary's per-task
+        # routing must never reach a different endpoint.
+        provider, key = fallback, "none"
+        model = os.environ.get("LLM_FALLBACK_MODEL") or fallback.default_model
+        provider_key = os.environ.get("LLM_FALLBACK_API_KEY")
+        degraded = True
+
+    start = time.perf_counter()
+    try:
+        response_text = provider.generate(prompt, model, provider_key)
     except Exception as e:
-        raise Exception(f"Failed to communicate with Google Gemini: {str(e)}")
+        raise Exception(f"Failed to communicate with {provider.name}: {str(e)}")
+    get_ledger().record(
+        session=session,
+        key=key,
+        task=task,
+        provider=provider.name,
+        model=model,
+        prompt_tokens=prompt_tokens,
+        response_tokens=estimate_tokens(response_text),
+        latency_seconds=round(time.perf_counter() - start, 3),
+        cached=False
+    )
+    if degraded:
+        # Produced by the fallback for this caller's exhausted budget: not for sharing
+        return DegradedResult(response_text)
+    return response_text
 
 def extract_text_from_url(url):
     """
     Extracts text from a job description URL using Jina Reader for better compatibility.
     Includes special handling for LinkedIn URLs to convert them to public viewable links.
+    Concurrent fetches of the same URL share a single request.
     """
+    content, _ = _single_flight.do(("url", url), lambda: _fetch_text_from_url(url))
+    return content
+
+def _fetch_text_from_url(url):
+    import requests
+
     try:
         # Special handling for LinkedIn personalized/collection URLs
         if "linkedin.com" in url and "currentJobId=" in url:
@@ -65,7 +595,7 @@ def extract_text_from_url(url):
             else:
                 raise Exception("We couldn't extract the job details from this link. Please copy-paste it manually.")
 
-        return content
+        return denoise_markdown(content)
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 403:
             raise Exception("Access blocked by the website. Manual copy-paste is required.")
@@ -76,23 +606,35 @@ def extract_text_from_url(url):
     except Exception as e:
         raise Exception(f"Extraction failed: {str(e)}")
 
-from pdfminer.high_level import extract_text
+def _read_file_bytes(file):
+    return file.getvalue() if hasattr(file, "getvalue") else file.read()
 
 def extract_text_from_pdf(file):
     """
-    Extracts text from a PDF file.
+    Extracts text from a PDF file. Concurrent extractions of identical files share one parse.
     """
-    return extract_text(file)
+    from pdfminer.high_level import extract_text
+
+    data = _read_file_bytes(file)
+    text, _ = _single_flight.do(("pdf", hashlib.sha256(data).hexdigest()), lambda: extract_text(io.BytesIO(data)))
+    return text
 
 def extract_text_from_docx(file):
     """
-    Extracts text from a DOCX file.
+    Extracts text from a DOCX file. Concurrent extractions of identical files share one parse.
     """
-    doc = Document(file)
-    full_text = []
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    return "\n".join(full_text)
+    from docx import Document
+
+    def parse(data):
+        doc = Document(io.BytesIO(data))
+        full_text = []
+        for para in doc.paragraphs:
+            full_text.append(para.text)
+        return "\n".join(full_text)
+
+    data = _read_file_bytes(file)
+    text, _ = _single_flight.do(("docx", hashlib.sha256(data).hexdigest()), lambda: parse(data))
+    return text
 
 import re
 
@@ -111,10 +653,177 @@ def clean_text(text):
     text = re.sub(r'--', '', text)
     return text.strip()
 
+_MARKDOWN_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_MARKDOWN_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_LINK_ONLY_LINE = re.compile(r'^\s*(?:[*+\-]\s*)?(?:\[[^\]]*\]\([^)]*\)[\s|·•,]*)+$')
+_BARE_URL = re.compile(r'https?://\S+')
+
+def denoise_markdown(text):
+    """
+    Strips navigation noise from fetched markdown: images, link-only lines (menus,
+    footers), bare URLs, Jina "URL Source" headers and repeated lines. Link text is kept.
+    """
+    cleaned = []
+    seen = set()
+    for line in text.split('\n'):
+        if _LINK_ONLY_LINE.match(line) or line.startswith("URL Source:"):
+            continue
+        line = _MARKDOWN_IMAGE.sub('', line)
+        line = _MARKDOWN_LINK.sub(r'\1', line)
+        line = _BARE_URL.sub('', line).rstrip()
+        key = line.strip().lower()
+        if key:
+            if key in seen:
+                continue
+            seen.add(key)
+        cleaned.append(line)
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(cleaned)).strip()
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    """
+    Splits text into chunks of at most max_chars, breaking on paragraphs, then lines.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split('\n'):
+            # Hard-split anything that still doesn't fit
+            pieces.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _condense_chunk(chunk, index, total, kind, api_key):
+    """
+    Condenses one chunk of an oversized input into a compact digest.
+    """
+    max_words = max(100, CHUNK_CHARS // 24)
+    prompt = f"""
+    You are condensing part {index} of {total} of a {kind} so it can be analyzed later.
+    
+    CRITICAL INSTRUCTIONS:
+    1. Keep every concrete fact: job titles, employers, dates, skills, tools, metrics, requirements and qualifications.
+    2. Drop boilerplate, navigation, legal text and repetition.
+    3. Output in plain text. No markdown formatting.
+    4. Use at most {max_words} words.
+    
+    Text:
+    {chunk}
+    """
+    response = call_llm(prompt, api_key, task="condense")
+    return clean_text(response)
+
+def condense_input(text, kind, api_key):
+    """
+    Returns text unchanged if it fits in a prompt. Otherwise splits it into chunks,
+    condenses them concurrently and joins the digests (map-reduce), repeating until
+    the result fits. Digests are cached by content hash.
+    """
+    if len(text) <= MAX_INPUT_CHARS:
+        return text
+
+    cache_key = _content_hash(kind, text)
+    cached_digest = _digest_cache.get(cache_key)
+    if cached_digest is not None:
+        _record_cache_hit("condense", estimate_tokens(text), api_key)
+        return cached_digest
+
+    digest = text
+    for _ in range(MAX_CONDENSE_ROUNDS):
+        if len(digest) <= MAX_INPUT_CHARS:
+            break
+        chunks = chunk_text(digest, CHUNK_CHARS)
+        with ThreadPoolExecutor(max_workers=min(MAX_CONDENSE_WORKERS, len(chunks))) as executor:
+            parts = list(executor.map(
+                _in_current_context(lambda args: _condense_chunk(args[1], args[0], len(chunks), kind, api_key)),
+                enumerate(chunks, start=1)
+            ))
+        digest = "\n\n".join(parts)
+    # Hard bound in case the model ignored the length limit
+    digest = digest[:MAX_INPUT_CHARS]
+
+    _digest_cache.set(cache_key, digest)
+    return digest
+
+def prepare_job_description(job_description, api_key):
+    """
+    Condenses an oversized job description for use in prompts. Fetched job
+    descriptions are already denoised by extract_text_from_url; pasted text is left as is.
+    """
+    return condense_input(job_description, "job description", api_key)
+
+def prepare_resume(resume_text, api_key):
+    """
+    Condenses an oversized resume for use in prompts.
+    """
+    return condense_input(resume_text, "resume", api_key)
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "you", "your", "our", "are", "will", "this", "that", "from",
+    "have", "has", "who", "what", "their", "they", "them", "able", "all", "any", "can", "such",
+    "into", "not", "but", "its", "work", "team", "role", "job", "experience", "including",
+    "years", "year", "must", "should", "would", "about", "other", "more", "well", "within",
+}
+
+class DegradedResult(str):
+    """
+    A fallback result produced without the LLM (e.g. local scoring under an exhausted
+    budget). It is shown to the user but never cached, so the real result replaces it
+    once budget is available again.
+    """
+
+
+def score_ats_locally(resume_text, job_description, max_keywords=25):
+    """
+    Estimates an ATS match score without an LLM by checking which of the job
+    description's most frequent keywords appear in the resume. Used when the AI
+    budget is exhausted and the budget policy is "degrade".
+    """
+    words = re.findall(r"[a-zA-Z][a-zA-Z+#.]{2,}", job_description.lower())
+    counts = {}
+    for word in words:
+        word = word.rstrip(".")
+        if word not in _STOPWORDS:
+            counts[word] = counts.get(word, 0) + 1
+    keywords = sorted(counts, key=lambda w: (-counts[w], w))[:max_keywords]
+    resume_words = set(w.rstrip(".") for w in re.findall(r"[a-zA-Z][a-zA-Z+#.]{2,}", resume_text.lower()))
+    missing = [w for w in keywords if w not in resume_words]
+    score = round(100 * (len(keywords) - len(missing)) / len(keywords)) if keywords else 0
+
+    lines = [f"Match Score: {score}/100 (estimated locally by keyword overlap; AI budget reached)", "", "Missing Keywords:"]
+    lines += [f"- {w}" for w in missing] or ["- None"]
+    lines += ["", "Improvement Suggestions:", "- Work the missing keywords into your experience and skills where they genuinely apply."]
+    return DegradedResult("\n".join(lines))
+
 def analyze_ats_score(resume_text, job_description, api_key):
     """
     Analyzes the resume against the job description and provides an ATS score.
+    Under the "degrade" budget policy, falls back to local keyword scoring.
     """
+    try:
+        return _analyze_ats_score_with_llm(resume_text, job_description, api_key)
+    except BudgetExceededError:
+        if os.environ.get("LLM_BUDGET_POLICY") != "degrade":
+            raise
+        # Score the raw inputs: condensing them would need the LLM too
+        return score_ats_locally(resume_text, job_description)
+
+def _analyze_ats_score_with_llm(resume_text, job_description, api_key):
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are an expert ATS (Applicant Tracking System) scanner. 
     Analyze the following resume against the job description.
@@ -138,13 +847,15 @@ def analyze_ats_score(resume_text, job_description, api_key):
     - [Suggestion 1]
     - [Suggestion 2]
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="ats")
     return clean_text(response)
 
 def generate_interview_questions(resume_text, job_description, api_key):
     """
     Generates industry-specific and technical interview questions based on resume and JD.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are an expert interviewer specializing in technical and industry-standard evaluations. 
     Based on the candidate's resume and the job description, generate 10 probable industry-specific and technical interview questions.
@@ -163,13 +874,15 @@ def generate_interview_questions(resume_text, job_description, api_key):
     Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="interview")
     return clean_text(response)
 
 def generate_career_insights(resume_text, job_description, api_key):
     """
     Generates career insights including salary negotiation and growth.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are a career consultant. Based on the candidate's resume and the job description, provide the following insights:
     1. Salary Negotiation: Estimated range based on industry status and specific tips for this role.
@@ -186,13 +899,15 @@ def generate_career_insights(resume_text, job_description, api_key):
     Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="insights")
     return clean_text(response)
 
 def generate_resume_content(resume_text, job_description, api_key):
     """
     Generates tailored resume content using LLM.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are an expert professional resume writer. Rewrite the following resume to tailor it for the job description provided.
     
@@ -209,13 +924,192 @@ def generate_resume_content(resume_text, job_description, api_key):
     Original Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="resume")
     return clean_text(response)
 
+_RESUME_HEADINGS = {
+    "summary", "professional summary", "profile", "objective", "experience", "work experience",
+    "professional experience", "employment history", "education", "skills", "technical skills",
+    "projects", "certifications", "awards", "publications", "languages", "volunteer experience",
+}
+
+# Words that make up section headings the list above doesn't name exactly, e.g. "Work History"
+_RESUME_HEADING_WORDS = {word for heading in _RESUME_HEADINGS for word in heading.split()} | {
+    "work", "history", "career", "employment", "qualifications", "achievements", "accomplishments",
+    "interests", "references", "training", "activities", "leadership", "coursework", "competencies",
+    "expertise", "highlights", "relevant", "core", "key", "additional", "and", "&", "of",
+}
+
+_NUMBERED_LINE = re.compile(r'^\s*\[(\d+)\]\s*(.*)$')
+
+def _is_section_heading(line):
+    """
+    A heading is a short line made up only of section-heading words, such as
+    "EXPERIENCE", "Skills:" or "Work History". Names ("JOHN DOE") and comma-separated
+    lists ("AWS, GCP, SQL") don't qualify.
+    """
+    stripped = line.strip().rstrip(":").strip()
+    if not stripped or len(stripped) > 40 or "," in stripped or stripped[0] in "-*•":
+        return False
+    words = stripped.lower().split()
+    return stripped.lower() in _RESUME_HEADINGS or (len(words) <= 4 and all(w in _RESUME_HEADING_WORDS for w in words))
+
+def split_resume_sections(resume_text):
+    """
+    Splits a resume into (heading, lines) sections. Lines before the first heading
+    (name, contact details) form a section with an empty heading.
+    """
+    sections = [("", [])]
+    for line in resume_text.split('\n'):
+        if _is_section_heading(line):
+            sections.append((line.strip(), []))
+        else:
+            sections[-1][1].append(line.rstrip())
+    return [section for section in sections if section[0] or any(l.strip() for l in section[1])]
+
+def _section_context(section_lines, changed_lines, max_chars=CHUNK_CHARS):
+    """
+    Returns the changed lines' immediate neighbours within their section, capped at
+    max_chars, so long sections (e.g. an academic Publications list) don't inflate the prompt.
+    """
+    lines = [line.strip() for line in section_lines if line.strip()]
+    changed = set(line.strip() for line in changed_lines)
+    keep = set()
+    for i, line in enumerate(lines):
+        if line in changed:
+            keep.update((i - 1, i, i + 1))
+    context = "\n".join(line for i, line in enumerate(lines) if i in keep and line not in changed)
+    return context[:max_chars]
+
+def _batch_lines(lines, max_chars=CHUNK_CHARS):
+    """
+    Groups lines into batches of at most max_chars each (a longer single line gets its own batch).
+    """
+    batches = []
+    size = 0
+    for line in lines:
+        if batches and size + len(line) <= max_chars:
+            batches[-1].append(line)
+            size += len(line)
+        else:
+            batches.append([line])
+            size = len(line)
+    return batches
+
+def _rewrite_section_lines(heading, section_lines, changed_lines, job_description, api_key):
+    """
+    Rewrites only the changed lines of one resume section, returning them in order.
+    Lines the model skips are kept as written.
+    """
+    numbered = "\n".join(f"[{n}] {line.strip()}" for n, line in enumerate(changed_lines, start=1))
+    context = _section_context(section_lines, changed_lines) or "(none)"
+    prompt = f"""
+    You are an expert professional resume writer. Rewrite the numbered lines from the "{heading}" section of a resume to tailor them for the job description provided.
+    
+    CRITICAL INSTRUCTIONS:
+    1. Write in a purely human, professional tone. Avoid robotic transitions or overused AI phrases.
+    2. Do NOT use any markdown formatting. No bold (**), no italics (*), no headers (#).
+    3. Do NOT use double dashes (--).
+    4. Target a 90%+ ATS match rate by naturally integrating keywords.
+    5. Rewrite each numbered line into exactly one line, keeping its number, e.g. "[1] Rewritten line". Output ONLY the numbered lines.
+    
+    Job Description:
+    {job_description}
+    
+    Surrounding Lines (for context only):
+    {context}
+    
+    Lines to Rewrite:
+    {numbered}
+    """
+    response = call_llm(prompt, api_key, task="resume")
+    rewritten = {}
+    for line in response.split('\n'):
+        match = _NUMBERED_LINE.match(line)
+        if match and match.group(2).strip():
+            rewritten[int(match.group(1))] = clean_text(match.group(2))
+    return [rewritten.get(n, line.strip()) for n, line in enumerate(changed_lines, start=1)]
+
+def generate_resume_content_incremental(resume_text, job_description, api_key, previous_state=None, max_workers=4):
+    """
+    Tailors a resume line by line, rewriting only lines that are new or changed since
+    previous_state. Unchanged lines are merged back from the cached rewrites, so small
+    edits cost a small LLM response. A changed job description invalidates every line.
+    Section headings and the contact block (everything before the first heading) are
+    kept as written. Without any recognisable heading, falls back to a full rewrite.
+    Returns (resume_text, state); pass state back as previous_state on the next call.
+    """
+    sections = split_resume_sections(resume_text)
+    if not any(heading for heading, _ in sections):
+        # No recognisable sections to diff against: rewrite the whole resume instead
+        return generate_resume_content(resume_text, job_description, api_key), {
+            "jd": None, "rewrites": {}, "rewritten_lines": 0, "reused_lines": 0, "full_rewrite": True
+        }
+
+    job_description = prepare_job_description(job_description, api_key)
+    jd_hash = _content_hash(job_description)
+    if previous_state and previous_state.get("jd") == jd_hash:
+        rewrites = dict(previous_state["rewrites"])
+    else:
+        rewrites = {}
+
+    pending = []
+    for heading, lines in sections:
+        if not heading:
+            continue
+        changed = []
+        changed_keys = set()
+        for line in lines:
+            line_key = _content_hash(heading, line.strip())
+            if line.strip() and line_key not in rewrites and line_key not in changed_keys:
+                changed.append(line)
+                changed_keys.add(line_key)
+        # Batch long runs of changes so every prompt stays bounded
+        for batch in _batch_lines(changed):
+            pending.append((heading, lines, batch))
+
+    def rewrite(section):
+        heading, lines, changed = section
+        return heading, changed, _rewrite_section_lines(heading, lines, changed, job_description, api_key)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            for heading, changed, rewritten in executor.map(_in_current_context(rewrite), pending):
+                for line, new_line in zip(changed, rewritten):
+                    rewrites[_content_hash(heading, line.strip())] = new_line
+
+    output = []
+    used_keys = set()
+    for heading, lines in sections:
+        if heading:
+            output.append(heading)
+        for line in lines:
+            if not heading or not line.strip():
+                output.append(line)
+                continue
+            line_key = _content_hash(heading, line.strip())
+            used_keys.add(line_key)
+            output.append(rewrites[line_key])
+        output.append("")
+
+    rewritten_lines = sum(len(changed) for _, _, changed in pending)
+    state = {
+        "jd": jd_hash,
+        # Drop rewrites for lines that no longer exist
+        "rewrites": {k: v for k, v in rewrites.items() if k in used_keys},
+        "rewritten_lines": rewritten_lines,
+        "reused_lines": len(used_keys) - rewritten_lines,
+        "full_rewrite": False,
+    }
+    text = re.sub(r'\n{3,}', '\n\n', '\n'.join(output)).strip()
+    return text, state
+
 def generate_cover_letter_content(resume_text, job_description, api_key):
     """
     Generates cover letter content using LLM.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are an expert career coach. Write a persuasive cover letter based on the candidate's resume and the job description.
     
@@ -232,13 +1126,15 @@ def generate_cover_letter_content(resume_text, job_description, api_key):
     Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="cover_letter")
     return clean_text(response)
 
 def generate_screening_questions(resume_text, job_description, api_key):
     """
     Generates 5-7 industry-standard screening questions based on JD and Resume.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are an expert recruiter. Based on the job description and the candidate's resume, generate 5-7 industry-standard screening questions.
     These should be questions that a recruiter would likely ask during an initial phone screen (e.g., salary expectations, relocation, core skills).
@@ -257,13 +1153,15 @@ def generate_screening_questions(resume_text, job_description, api_key):
     Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="screening")
     return clean_text(response)
 
 def generate_final_interview_questions(resume_text, job_description, api_key):
     """
     Generates final-round behavioral and culture-fit questions.
     """
+    resume_text = prepare_resume(resume_text, api_key)
+    job_description = prepare_job_description(job_description, api_key)
     prompt = f"""
     You are a Hiring Manager preparing for a final-round interview. 
     Based on the candidate's resume and the job description, generate 5 high-impact final interview questions.
@@ -283,13 +1181,23 @@ def generate_final_interview_questions(resume_text, job_description, api_key):
     Resume:
     {resume_text}
     """
-    response = call_llm(prompt, api_key)
+    response = call_llm(prompt, api_key, task="final_interview")
     return clean_text(response)
 
 def provide_interview_feedback(question, answer, job_description, api_key):
     """
     Provides feedback on a user's answer to a specific interview question.
+    Results are memoized on the answer hash, so re-submitting an unchanged answer is instant.
     """
+    question = question.strip()
+    answer = answer.strip()
+    job_description = prepare_job_description(job_description, api_key)
+    cache_key = _content_hash(question, answer, job_description)
+    cached_feedback = _feedback_cache.get(cache_key)
+    if cached_feedback is not None:
+        _record_cache_hit("feedback", estimate_tokens(question + answer + job_description + cached_feedback), api_key)
+        return cached_feedback
+
     prompt = f"""
     You are an expert interview coach. Evaluate the following answer to an interview question.
     
@@ -311,13 +1219,148 @@ def provide_interview_feedback(question, answer, job_description, api_key):
     1. Output in plain text. No markdown formatting.
     2. Do NOT use double dashes (--).
     """
-    response = call_llm(prompt, api_key)
-    return clean_text(response)
+    response = call_llm(prompt, api_key, task="feedback")
+    feedback = clean_text(response)
+    _feedback_cache.set(cache_key, feedback)
+    return feedback
+
+def provide_batch_interview_feedback(qa_pairs, job_description, api_key, max_workers=4):
+    """
+    Grades several (question, answer) pairs concurrently against the same job description.
+    Returns the feedback in the same order as qa_pairs. Duplicate and previously graded
+    answers are served from the feedback cache without another LLM call.
+    """
+    pairs = [(question.strip(), answer.strip()) for question, answer in qa_pairs]
+    unique_pairs = list(dict.fromkeys(pairs))
+    if not unique_pairs:
+        return []
+    # Condense the shared job description once, up front, for every grading call
+    job_description = prepare_job_description(job_description, api_key)
+
+    def grade(pair):
+        return provide_interview_feedback(pair[0], pair[1], job_description, api_key)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_pairs)))) as executor:
+        results = dict(zip(unique_pairs, executor.map(_in_current_context(grade), unique_pairs)))
+    return [results[pair] for pair in pairs]
+
+# Task name -> generator, used by the result cache and speculative prefetch
+GENERATION_TASKS = {
+    "ats": analyze_ats_score,
+    "resume": generate_resume_content,
+    "cover_letter": generate_cover_letter_content,
+    "interview": generate_interview_questions,
+    "insights": generate_career_insights,
+    "screening": generate_screening_questions,
+    "final_interview": generate_final_interview_questions,
+}
+
+# Tasks produced by the "Generate Documents" suite, in generation order
+SUITE_TASKS = ("resume", "cover_letter", "interview", "insights", "screening", "final_interview")
+
+def get_cached_result(task, resume_text, job_description):
+    """
+    Returns the cached result for a task on these inputs, or None if it hasn't been computed.
+    """
+    return _result_cache.get((task, _content_hash(resume_text, job_description)))
+
+def run_cached(task, resume_text, job_description, api_key):
+    """
+    Runs a generation task, reusing the cached result if these inputs were already processed.
+    """
+    cache_key = (task, _content_hash(resume_text, job_description))
+    cached_result = _result_cache.get(cache_key)
+    if cached_result is not None:
+        _record_cache_hit(task, estimate_tokens(resume_text + job_description + cached_result), api_key)
+        return cached_result
+
+    def compute():
+        result = GENERATION_TASKS[task](resume_text, job_description, api_key)
+        if not isinstance(result, DegradedResult):
+            _result_cache.set(cache_key, result)
+        return result
+
+    # Identical jobs already running (another tab, user or the prefetcher) are joined, not repeated
+    result, shared = _single_flight.do(
+        ("task",) + cache_key,
+        compute,
+        shareable=lambda result: not isinstance(result, DegradedResult)
+    )
+    if shared:
+        _record_cache_hit(task, estimate_tokens(resume_text + job_description + result), api_key, coalesced=True)
+    return result
+
+class SpeculativePrefetcher:
+    """
+    Runs generation tasks in the background once the inputs have been stable for
+    debounce_seconds, filling the result cache so the UI can show them instantly.
+    Scheduling different inputs cancels any pending or in-progress speculative work.
+    """
+
+    def __init__(self, debounce_seconds=2.0):
+        self.debounce_seconds = debounce_seconds
+        self.error = None
+        self._lock = threading.Lock()
+        self._inputs_hash = None
+        self._cancel_event = None
+        self._thread = None
+
+    def schedule(self, resume_text, job_description, api_key, tasks):
+        """
+        Starts speculative work for these inputs unless it is already scheduled.
+        """
+        inputs_hash = _content_hash(resume_text, job_description, *tasks)
+        with self._lock:
+            if inputs_hash == self._inputs_hash:
+                return
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+            cancel_event = threading.Event()
+            self._cancel_event = cancel_event
+            self._inputs_hash = inputs_hash
+            self.error = None
+            self._thread = threading.Thread(
+                target=_in_current_context(self._run),
+                args=(cancel_event, resume_text, job_description, api_key, tuple(tasks)),
+                daemon=True
+            )
+            self._thread.start()
+
+    def cancel(self):
+        """
+        Cancels any pending or in-progress speculative work.
+        """
+        with self._lock:
+            if self._cancel_event is not None:
+                self._cancel_event.set()
+            self._cancel_event = None
+            self._inputs_hash = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, cancel_event, resume_text, job_description, api_key, tasks):
+        # Debounce: give up if the inputs change before they settle
+        if cancel_event.wait(self.debounce_seconds):
+            return
+        for task in tasks:
+            # An in-flight LLM call can't be interrupted, so check between tasks
+            if cancel_event.is_set():
+                return
+            try:
+                run_cached(task, resume_text, job_description, api_key)
+            except Exception as e:
+                # A superseded run must not report its failure against newer inputs
+                if not cancel_event.is_set():
+                    self.error = str(e)
+                return
 
 def generate_docx_from_text(text_content):
     """
     Generates a DOCX file from raw text.
     """
+    from docx import Document
+
     doc = Document()
     # Split by newlines and add as paragraphs
     for line in text_content.split('\n'):
@@ -330,6 +1373,9 @@ def generate_docx_from_text(text_content):
     return file_stream
 
 def generate_pdf_from_text(text_content):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
     buffer = io.BytesIO()
     p = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter